@@ -0,0 +1,587 @@
+#!/usr/bin/env python3
+"""
+FasterWhisper STT server for openclaw-voice.
+
+Runs on port 5001 and serves the Node bot (src/modules/transcription.js):
+  POST /transcribe     - one-shot transcription ({"path": ...} or {"audio": <base64 wav>})
+  POST /stream/start   - open a streaming session
+  POST /stream/audio   - push a chunk of audio for a session
+  POST /stream/end     - close a session, get the final text
+  GET  /ws             - WebSocket streaming transcription
+  GET  /health         - health check
+
+Audio is decoded in memory and handed to faster-whisper as a float32 PCM
+array - no temp files on the per-chunk path.
+"""
+import os
+
+# OpenMP/CTranslate2 knobs must be in the environment before ctranslate2
+# loads. Pin threads to cores so int8 GEMMs don't migrate, and leave
+# CT2_VERBOSE on so the kernel dispatch (AVX2 vs AVX-512 VNNI) shows up
+# once in the startup log.
+os.environ.setdefault('OMP_PROC_BIND', 'close')
+os.environ.setdefault('OMP_PLACES', 'cores')
+os.environ.setdefault('CT2_VERBOSE', '1')
+
+import asyncio
+import concurrent.futures
+import io
+import itertools
+import logging
+from collections import namedtuple
+
+import msgpack
+import numpy as np
+import orjson
+import pybase64
+import soundfile as sf
+from aiohttp import web, WSMsgType
+from cachetools import TTLCache
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+log = logging.getLogger('whisper-server')
+
+MODEL_SIZE = os.environ.get('WHISPER_MODEL', 'tiny')
+SAMPLE_RATE = 16000
+
+# Pool size 1 keeps the default a single model with every core - the best
+# shape for one stream at a time, which is the common case for this bot.
+# Raising it trades single-stream speed for N streams decoding in
+# parallel on N replicas, each budgeted cores/N threads.
+N_CPU_TRANSCRIBE = int(os.environ.get('WHISPER_POOL_SIZE', 1))
+
+# Pick the fastest compute path for the hardware: on CUDA keep the weights
+# int8 (memory-bandwidth win) with fp16 activations on tensor cores; on CPU
+# stay fully int8.
+try:
+    import ctranslate2
+    _has_cuda = ctranslate2.get_cuda_device_count() > 0
+except Exception:
+    _has_cuda = False
+
+if _has_cuda:
+    DEVICE, COMPUTE_TYPE = 'cuda', 'int8_float16'
+else:
+    DEVICE, COMPUTE_TYPE = 'cpu', 'int8'
+
+# A single CTranslate2 instance serializes encoder runs, so concurrent
+# worker threads would still queue behind one model. On CPU, load one
+# replica per worker thread instead so the replicas run genuinely in
+# parallel without thread-pool contention. On GPU one instance is
+# enough - the device itself is the serializer.
+N_REPLICAS = N_CPU_TRANSCRIBE if DEVICE == 'cpu' else 1
+
+# Per-replica OMP thread budget. OMP_NUM_THREADS still wins if set.
+CPU_THREADS = int(os.environ.get('OMP_NUM_THREADS', 0)) or \
+    max(1, (os.cpu_count() or 1) // N_REPLICAS)
+
+def _load_pipeline():
+    m = WhisperModel(MODEL_SIZE, device=DEVICE, compute_type=COMPUTE_TYPE,
+                     cpu_threads=CPU_THREADS, num_workers=1)
+    return BatchedInferencePipeline(model=m)
+
+
+# Executor choice: threads by default (CTranslate2 releases the GIL for the
+# forward pass), or WHISPER_EXECUTOR=process for a process pool where each
+# worker owns its model - the Python-side segment drain and post-processing
+# then run GIL-free in parallel too, which wins under many concurrent
+# streams on big CPUs.
+EXECUTOR_MODE = os.environ.get('WHISPER_EXECUTOR', 'thread')
+
+_WORKER_PIPELINE = None  # set by _proc_init inside each pool process
+
+
+def _proc_init():
+    global _WORKER_PIPELINE
+    _WORKER_PIPELINE = _load_pipeline()
+
+
+_replica_counter = itertools.count()
+
+if EXECUTOR_MODE == 'process':
+    # Workers load their own model via the initializer; the parent stays
+    # model-free.
+    log.info("🎤 FasterWhisper model: %s (%s/%s, %d worker process(es))",
+             MODEL_SIZE, DEVICE, COMPUTE_TYPE, N_CPU_TRANSCRIBE)
+    PIPELINES = []
+    TRANSCRIBE_POOL = concurrent.futures.ProcessPoolExecutor(
+        max_workers=N_CPU_TRANSCRIBE, initializer=_proc_init)
+else:
+    log.info("🎤 Loading FasterWhisper model: %s (%s/%s, %d replica(s))",
+             MODEL_SIZE, DEVICE, COMPUTE_TYPE, N_REPLICAS)
+    PIPELINES = [_load_pipeline() for _ in range(N_REPLICAS)]
+    TRANSCRIBE_POOL = concurrent.futures.ThreadPoolExecutor(
+        max_workers=N_CPU_TRANSCRIBE, thread_name_prefix='transcribe')
+    log.info("🎤 Model loaded")
+
+
+def pick_pipeline():
+    """The worker's own pipeline in process mode, else round-robin across
+    the in-process replicas."""
+    if _WORKER_PIPELINE is not None:
+        return _WORKER_PIPELINE
+    return PIPELINES[next(_replica_counter) % N_REPLICAS]
+
+
+# Lightweight, picklable segment - process-pool results cross an IPC
+# boundary, and handlers only need the timestamps and text anyway.
+Seg = namedtuple('Seg', 'start end text')
+
+
+# Micro-batching: chunks from different streams arriving within a short
+# window are coalesced and dispatched to the worker pool as one job, so the
+# batched pipeline amortizes its fixed per-call overhead across streams.
+MAX_BATCH = int(os.environ.get('WHISPER_MAX_BATCH', 8))
+BATCH_WINDOW_S = 0.02
+_pending = None  # asyncio.Queue of (pcm, future, kwargs), created at startup
+
+
+def _run_batch(batch):
+    """Run a coalesced batch of transcriptions on a pool worker.
+
+    faster-whisper returns a lazy generator - drain it here so the decode
+    work happens off the event loop too.
+    """
+    pipeline = pick_pipeline()
+    results = []
+    for audio, kwargs in batch:
+        kwargs = dict(kwargs)
+        if kwargs.pop('sequential', False):
+            # Sequential decode for the streaming paths: emits real
+            # multi-segment output and, unlike the batched pipeline,
+            # accepts vad_filter=False regardless of audio duration.
+            segments, info = pipeline.model.transcribe(audio, **kwargs)
+        else:
+            segments, info = pipeline.transcribe(audio, batch_size=MAX_BATCH, **kwargs)
+        results.append(([Seg(s.start, s.end, s.text) for s in segments],
+                        info.language))
+    return results
+
+
+_dispatch_tasks = set()
+
+
+async def _dispatch_batch(batch, futures):
+    loop = asyncio.get_running_loop()
+    try:
+        results = await loop.run_in_executor(TRANSCRIBE_POOL, _run_batch, batch)
+    except Exception as e:
+        for f in futures:
+            if not f.done():
+                f.set_exception(e)
+    else:
+        for f, result in zip(futures, results):
+            if not f.done():
+                f.set_result(result)
+
+
+async def _batch_scheduler():
+    while True:
+        audio, future, kwargs = await _pending.get()
+        if _pending.qsize() + 1 < MAX_BATCH:
+            await asyncio.sleep(BATCH_WINDOW_S)  # let concurrent chunks pile up
+        batch = [(audio, kwargs)]
+        futures = [future]
+        while len(batch) < MAX_BATCH and not _pending.empty():
+            audio, future, kwargs = _pending.get_nowait()
+            batch.append((audio, kwargs))
+            futures.append(future)
+        # Dispatch without awaiting so up to pool-size batches run in
+        # parallel; the executor queues any overflow.
+        task = asyncio.create_task(_dispatch_batch(batch, futures))
+        _dispatch_tasks.add(task)
+        task.add_done_callback(_dispatch_tasks.discard)
+
+
+async def transcribe_async(audio, **kwargs):
+    future = asyncio.get_running_loop().create_future()
+    await _pending.put((audio, future, kwargs))
+    return await future
+
+
+async def _start_batcher(app):
+    global _pending
+    _pending = asyncio.Queue()
+    app['batcher'] = asyncio.create_task(_batch_scheduler())
+
+
+async def _stop_batcher(app):
+    app['batcher'].cancel()
+
+
+def _warm_one():
+    """One full lazy-init pass on whichever replica (thread mode) or
+    worker process picks this up."""
+    silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+    pipeline = pick_pipeline()
+    segments, _info = pipeline.transcribe(silence, batch_size=MAX_BATCH,
+                                          language='en', beam_size=1,
+                                          vad_filter=False)
+    list(segments)
+
+
+async def _warmup(app):
+    """Pay CTranslate2's lazy init (kernel dispatch tables, mel filter
+    banks, tokenizer cache) on synthetic silence at startup instead of
+    adding 1-2 s to the first user-visible transcription.
+
+    Every replica/worker initializes lazily, so issue one concurrent
+    warmup job per pool slot - sent straight to the executor, since the
+    batcher would coalesce them onto a single replica.
+    """
+    has_speech(np.zeros(SAMPLE_RATE, dtype=np.float32))  # warm Silero too
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(TRANSCRIBE_POOL, _warm_one)
+                           for _ in range(N_CPU_TRANSCRIBE)))
+    log.info("🎤 Warmup complete")
+
+
+async def _clear_streams(app):
+    async with streams_lock:
+        streams.clear()
+        transcription_buffer.clear()
+
+
+# Strictly under Whisper's 30 s window so a full buffer still decodes as
+# one pass with a margin.
+BUFFER_SAMPLES = 29 * SAMPLE_RATE
+
+# When the buffer gets this full, finalize every segment instead of keeping
+# the last one open - otherwise the next append() would silently drop the
+# oldest audio and the words in it.
+COMMIT_PRESSURE_SAMPLES = BUFFER_SAMPLES - 5 * SAMPLE_RATE
+
+
+class StreamState:
+    """Per-stream transcription state.
+
+    Keeps the un-committed tail of the stream's audio in a fixed float32
+    buffer. Segments the model has finalized are folded into
+    committed_text and their samples dropped, so each chunk only
+    re-transcribes the tail instead of the whole stream.
+    """
+    def __init__(self, stream_id):
+        self.stream_id = stream_id
+        self.pcm = np.zeros(BUFFER_SAMPLES, dtype=np.float32)
+        self.write_pos = 0
+        self.vad_scanned = 0  # leading samples already run through the VAD gate
+        self.committed_text = ''
+        self.partial_result = ''
+
+    def append(self, new_pcm):
+        n = len(new_pcm)
+        if n >= BUFFER_SAMPLES:
+            self.pcm[:] = new_pcm[-BUFFER_SAMPLES:]
+            self.write_pos = BUFFER_SAMPLES
+            self.vad_scanned = 0
+            return
+        overflow = self.write_pos + n - BUFFER_SAMPLES
+        if overflow > 0:
+            # Buffer full - drop the oldest audio to make room.
+            self.pcm[:self.write_pos - overflow] = self.pcm[overflow:self.write_pos]
+            self.write_pos -= overflow
+            self.vad_scanned = max(0, self.vad_scanned - overflow)
+        self.pcm[self.write_pos:self.write_pos + n] = new_pcm
+        self.write_pos += n
+
+    def audio(self):
+        return self.pcm[:self.write_pos]
+
+    def commit_samples(self, sample_end):
+        """Drop committed samples from the front of the buffer."""
+        sample_end = min(sample_end, self.write_pos)
+        keep = self.write_pos - sample_end
+        if keep > 0:
+            self.pcm[:keep] = self.pcm[sample_end:self.write_pos]
+        self.write_pos = keep
+        self.vad_scanned = max(0, self.vad_scanned - sample_end)
+
+
+# Stream state is keyed by client-supplied ids, and clients can vanish
+# mid-stream (WebSocket drops, abandoned HTTP sessions), so abandoned
+# entries must self-expire or the server leaks a StreamState per lost
+# client forever.
+STREAM_TTL_S = 600
+streams = TTLCache(maxsize=1024, ttl=STREAM_TTL_S)  # stream_id -> StreamState
+transcription_buffer = TTLCache(maxsize=1024, ttl=STREAM_TTL_S)  # stream_id -> text
+streams_lock = asyncio.Lock()  # TTLCache mutates on reads too (expiry sweep)
+
+
+# Standalone VAD gate: Silero over a chunk costs milliseconds, the encoder
+# costs hundreds - skip the model entirely for silent chunks (idle pauses,
+# push-to-talk gaps) and answer with what we already have.
+VAD_OPTIONS = VadOptions(min_silence_duration_ms=500)
+VAD_LOOKBACK_SAMPLES = SAMPLE_RATE // 2
+
+
+def has_speech(pcm):
+    return bool(get_speech_timestamps(pcm, VAD_OPTIONS))
+
+
+def decode_pcm(audio_bytes):
+    """Decode container audio (WAV/FLAC/...) to mono float32 PCM at 16 kHz."""
+    pcm, sr = sf.read(io.BytesIO(audio_bytes), dtype='float32', always_2d=False)
+    if pcm.ndim > 1:
+        pcm = pcm.mean(axis=1)
+    if sr != SAMPLE_RATE:
+        from scipy.signal import resample_poly
+        g = np.gcd(sr, SAMPLE_RATE)
+        pcm = resample_poly(pcm, SAMPLE_RATE // g, sr // g).astype(np.float32)
+    return pcm
+
+
+# ====================
+# RESPONSES
+# ====================
+def json_response(obj, status=200):
+    """Serialize with orjson instead of aiohttp's json.dumps path."""
+    return web.Response(body=orjson.dumps(obj), status=status,
+                        content_type='application/json')
+
+
+def _dumps_str(obj):
+    return orjson.dumps(obj).decode()
+
+
+# Pre-serialized bodies for the constant responses on the chunk path.
+_INVALID_JSON = orjson.dumps({'error': 'invalid json'})
+_UNKNOWN_STREAM = orjson.dumps({'error': 'unknown stream'})
+
+
+def invalid_json():
+    return web.Response(body=_INVALID_JSON, status=400,
+                        content_type='application/json')
+
+
+def unknown_stream():
+    return web.Response(body=_UNKNOWN_STREAM, status=404,
+                        content_type='application/json')
+
+
+async def read_body(request):
+    """Parse a request body as msgpack or JSON depending on Content-Type.
+
+    The msgpack profile carries 'audio' as raw bytes - no base64 inflate,
+    no JSON string scan - so per-chunk parse cost drops from hundreds of
+    microseconds to tens and the payload shrinks ~25%.
+    """
+    raw = await request.read()
+    if request.content_type == 'application/msgpack':
+        data = msgpack.unpackb(raw, raw=False)
+    else:
+        data = orjson.loads(raw)
+    if not isinstance(data, dict):
+        # valid JSON/msgpack but not an object ("x", [1]) - same 400 path
+        # as a parse failure, not an AttributeError further down.
+        raise ValueError('request body must be an object')
+    return data
+
+
+def audio_field_bytes(data):
+    """Return the audio payload as bytes: raw in the msgpack profile,
+    base64 text in the JSON profile."""
+    audio = data['audio']
+    if isinstance(audio, bytes):
+        return audio
+    return pybase64.b64decode(audio, validate=False)
+
+
+# ====================
+# HTTP HANDLERS
+# ====================
+async def health(request):
+    return json_response({'status': 'ok', 'model': MODEL_SIZE})
+
+
+async def transcribe(request):
+    """One-shot transcription. Accepts {"path": ...} (used by the Node bot)
+    or {"audio": <base64 wav>}."""
+    try:
+        data = await read_body(request)
+    except ValueError:
+        return invalid_json()
+
+    try:
+        if 'path' in data:
+            with open(data['path'], 'rb') as f:
+                audio_bytes = f.read()
+        elif 'audio' in data:
+            audio_bytes = audio_field_bytes(data)
+        else:
+            return json_response({'error': 'need path or audio'}, status=400)
+
+        pcm = decode_pcm(audio_bytes)
+        segments, language = await transcribe_async(pcm, language='en', beam_size=5)
+        # segment.text already carries a leading space; joining on '' avoids
+        # doubling it and skips the intermediate list.
+        text = ''.join(s.text for s in segments).strip()
+        return json_response({'text': text, 'language': language})
+    except (KeyError, ValueError, RuntimeError, OSError) as e:
+        log.exception("transcribe failed")
+        return json_response({'error': str(e)}, status=500)
+
+
+async def stream_start(request):
+    try:
+        data = await read_body(request)
+    except ValueError:
+        return invalid_json()
+
+    stream_id = data.get('stream_id')
+    if not stream_id:
+        return json_response({'error': 'need stream_id'}, status=400)
+
+    async with streams_lock:
+        streams[stream_id] = StreamState(stream_id)
+        transcription_buffer[stream_id] = ''
+    return json_response({'stream_id': stream_id, 'status': 'started'})
+
+
+async def stream_audio(request):
+    """Push a chunk of audio for a stream, get partial text back."""
+    try:
+        data = await read_body(request)
+    except ValueError:
+        return invalid_json()
+
+    stream_id = data.get('stream_id')
+    async with streams_lock:
+        state = streams.get(stream_id)
+    if state is None:
+        return unknown_stream()
+
+    try:
+        audio_bytes = audio_field_bytes(data)
+        new_pcm = decode_pcm(audio_bytes)
+        state.append(new_pcm)
+
+        # Gate on the newly appended audio only, with a short lookback so
+        # speech spanning the chunk boundary isn't split. The watermark
+        # advances whether or not speech was found, so a silent chunk
+        # arriving after an utterance costs one short Silero pass instead
+        # of re-running the encoder over the whole buffered tail.
+        scan_from = max(0, state.vad_scanned - VAD_LOOKBACK_SAMPLES)
+        new_audio = state.audio()[scan_from:]
+        state.vad_scanned = state.write_pos
+        if not has_speech(new_audio):
+            stale = (state.committed_text + ' ' + state.partial_result).strip()
+            return json_response({'text': stale, 'partial': True})
+
+        segments, _ = await transcribe_async(
+            state.audio(), language='en', beam_size=5, vad_filter=False,
+            sequential=True)
+
+        if segments:
+            # All but the last segment are finalized - fold them into the
+            # committed transcript and drop their samples so the next chunk
+            # only re-runs the encoder on the tail. Under buffer pressure
+            # the last segment is finalized too.
+            pressured = state.write_pos >= COMMIT_PRESSURE_SAMPLES
+            finalized = segments if pressured else segments[:-1]
+            if finalized:
+                committed = ''.join(s.text for s in finalized).strip()
+                state.committed_text = (state.committed_text + ' ' + committed).strip()
+                state.commit_samples(int(finalized[-1].end * SAMPLE_RATE))
+            state.partial_result = '' if pressured else segments[-1].text.strip()
+
+        result_text = (state.committed_text + ' ' + state.partial_result).strip()
+        async with streams_lock:
+            transcription_buffer[stream_id] = result_text
+        return json_response({'text': result_text, 'partial': True})
+    except (KeyError, ValueError, RuntimeError) as e:
+        log.exception("stream_audio failed")
+        stale = (state.committed_text + ' ' + state.partial_result).strip()
+        return json_response({'text': stale, 'partial': True})
+
+
+async def stream_end(request):
+    try:
+        data = await read_body(request)
+    except ValueError:
+        return invalid_json()
+
+    stream_id = data.get('stream_id')
+    async with streams_lock:
+        state = streams.pop(stream_id, None)
+        final_text = transcription_buffer.pop(stream_id, '')
+    if state is None:
+        return unknown_stream()
+    return json_response({'text': final_text, 'final': True})
+
+
+# ====================
+# WEBSOCKET
+# ====================
+async def ws_transcribe(request):
+    """WebSocket streaming: client sends raw PCM16 (16 kHz mono,
+    little-endian) as binary frames, server replies with {"text": ...} per
+    frame. Text frames carry control messages ({"get_result": true}) and,
+    for older clients, the legacy {"audio": <base64 wav>} envelope."""
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+
+    partial = ''
+
+    async def run(pcm):
+        nonlocal partial
+        if not has_speech(pcm):
+            await ws.send_json({'text': partial, 'partial': True}, dumps=_dumps_str)
+            return
+        segments, _ = await transcribe_async(
+            pcm, language='en', beam_size=5, vad_filter=False,
+            sequential=True)
+        partial = ''.join(s.text for s in segments).strip()
+        await ws.send_json({'text': partial, 'partial': True}, dumps=_dumps_str)
+
+    async for msg in ws:
+        if msg.type == WSMsgType.BINARY:
+            # Raw PCM16 frame: no JSON scan, no base64 inflate, one
+            # dtype conversion and straight into the model.
+            try:
+                pcm = np.frombuffer(msg.data, dtype=np.int16).astype(np.float32) / 32768.0
+                await run(pcm)
+            except (ValueError, RuntimeError):
+                log.exception("ws binary frame failed")
+                await ws.send_json({'text': partial, 'partial': True}, dumps=_dumps_str)
+        elif msg.type == WSMsgType.TEXT:
+            try:
+                data = orjson.loads(msg.data)
+                if not isinstance(data, dict):
+                    raise ValueError('text frame must be a JSON object')
+                if 'audio' in data:
+                    audio_bytes = pybase64.b64decode(data['audio'], validate=False)
+                    await run(decode_pcm(audio_bytes))
+                elif data.get('get_result'):
+                    await ws.send_json({'text': partial, 'final': True}, dumps=_dumps_str)
+            except (KeyError, ValueError, RuntimeError):
+                log.exception("ws text frame failed")
+                await ws.send_json({'text': partial, 'partial': True}, dumps=_dumps_str)
+        elif msg.type == WSMsgType.ERROR:
+            log.warning("ws connection error: %s", ws.exception())
+
+    return ws
+
+
+def main():
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app.router.add_get('/health', health)
+    app.router.add_post('/transcribe', transcribe)
+    app.router.add_post('/stream/start', stream_start)
+    app.router.add_post('/stream/audio', stream_audio)
+    app.router.add_post('/stream/end', stream_end)
+    app.router.add_get('/ws', ws_transcribe)
+
+    app.on_startup.append(_start_batcher)
+    app.on_startup.append(_warmup)
+    app.on_shutdown.append(_clear_streams)
+    app.on_cleanup.append(_stop_batcher)
+
+    port = int(os.environ.get('WHISPER_PORT', 5001))
+    log.info("🎤 STT server listening on port %d", port)
+    web.run_app(app, host='127.0.0.1', port=port, print=None)
+
+
+if __name__ == '__main__':
+    main()